@@ -1,5 +1,7 @@
 import os
+import asyncio
 import logging
+import time
 from telegram import Update
 from telegram.ext import (
     ApplicationBuilder,
@@ -10,250 +12,355 @@ from telegram.ext import (
 )
 from datetime import datetime, timedelta
 import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
 from config import BOT_TOKEN, MAX_PARTICIPANTS, RESPONSES
 from utils import log_command
-from keep_alive import keep_alive
+from keep_alive import keep_alive, stop_keep_alive
 
 # Setup logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Reply templates with MAX_PARTICIPANTS filled in; only the count is left to format
+_PARTICIPATED_TMPL = RESPONSES['participated'].format('{}', MAX_PARTICIPANTS)
+_REMOVED_TMPL = RESPONSES['removed'].format('{}', MAX_PARTICIPANTS)
+
+# When each (chat_id, user_id) was last confirmed as an admin. Non-admins are never
+# cached, so a promotion takes effect at once; a demoted admin keeps access until expiry.
+_ADMIN_CACHE: dict[tuple[int, int], float] = {}
+
+# Seconds an admin lookup stays valid
+ADMIN_CACHE_TTL = 60
+
 # Database setup
-def setup_database():
+# All SQLite work runs on this one thread, which owns the connection
+_DB_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db')
+_CONN = None
+
+# In-memory copy of the participants table as (user_id, username) rows
+_PARTICIPANTS: list[tuple[int, str]] = []
+
+# Rendered participants list, reset whenever the list changes
+_CACHED_LIST_STR: str | None = None
+
+# Writes not yet committed to the database, as (sql, params) pairs
+_PENDING: list[tuple[str, tuple]] = []
+
+# Seconds between commits of queued writes
+FLUSH_INTERVAL = 0.2
+
+# Longest wait between retries while flushes keep failing
+FLUSH_BACKOFF_MAX = 30
+
+# Consecutive failed flushes, used to back off the retry interval
+_FLUSH_FAILURES = 0
+
+# Background task running flush_pending_periodically()
+_FLUSH_TASK: asyncio.Task | None = None
+
+# Serializes flushes so a retried batch is never overtaken by a later one
+_FLUSH_LOCK = asyncio.Lock()
+
+_INSERT_SQL = "INSERT INTO participants (user_id, username) VALUES (?, ?)"
+_DELETE_LAST_SQL = """
+    DELETE FROM participants 
+    WHERE id = (
+        SELECT id FROM participants 
+        WHERE user_id=? 
+        ORDER BY id DESC LIMIT 1
+    )
+"""
+_CLEAR_SQL = "DELETE FROM participants"
+
+def _open_database():
+    """Open the database on the DB thread and return the stored participants"""
+    global _CONN
+    # Create the long-lived database connection
+    conn = sqlite3.connect('participants.db')
+    cursor = conn.cursor()
+
+    # Create the table without chat_id, keeping any existing list
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT
+        )
+    ''')
+    # Lets the delete-latest-entry lookup seek by user instead of scanning
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_id ON participants(user_id)')
+    conn.commit()
+
+    # Tune the connection once instead of paying for it on every message
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.execute('PRAGMA cache_size=-64000')
+
+    cursor.execute('SELECT user_id, username FROM participants ORDER BY id')
+    rows = cursor.fetchall()
+
+    _CONN = conn
+    return rows
+
+def _close_database():
+    """Close the connection on the DB thread, checkpointing the WAL"""
+    global _CONN
+    if _CONN:
+        _CONN.close()
+        _CONN = None
+
+async def setup_database():
     """Initialize SQLite database"""
     try:
-        # Create a new database connection
-        conn = sqlite3.connect('participants.db')
-        cursor = conn.cursor()
-
-        # Drop existing table if it exists
-        cursor.execute('DROP TABLE IF EXISTS participants')
-
-        # Create the table without chat_id
-        cursor.execute('''
-            CREATE TABLE participants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                username TEXT
-            )
-        ''')
-        conn.commit()
+        # Load the current list once; reads are served from memory afterwards
+        loop = asyncio.get_running_loop()
+        _PARTICIPANTS[:] = await loop.run_in_executor(_DB_EXECUTOR, _open_database)
         logger.info("Database initialized successfully")
     except sqlite3.Error as e:
-        logger.error(f"Database initialization error: {e}")
-    finally:
-        if conn:
-            conn.close()
+        # Without the database nothing would be persisted, so refuse to start
+        logger.error("Database initialization error: %s", e)
+        raise
+
+async def close_database():
+    """Close the database once all queued writes are persisted"""
+    await flush_pending()
+    if _PENDING:
+        logger.error("Closing database with %d unsaved writes; they are lost", len(_PENDING))
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_DB_EXECUTOR, _close_database)
 
 def get_db():
-    """Get database connection"""
-    return sqlite3.connect('participants.db', check_same_thread=False)
+    """Get the shared database connection (only usable on the DB thread)"""
+    return _CONN
+
+def _invalidate_list_cache():
+    """Drop the rendered participants list after a mutation"""
+    global _CACHED_LIST_STR
+    _CACHED_LIST_STR = None
 
 def get_participants_count():
     """Get current number of participants"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM participants")
-    count = cursor.fetchone()[0]
-    conn.close()
-    return count
+    return len(_PARTICIPANTS)
 
 def add_participant(user_id: int, username: str):
-    """Add a participant to the database"""
-    if get_participants_count() >= MAX_PARTICIPANTS:
-        logger.info(f"List full, cannot add user {username}")
-        return False
+    """Add a participant if the list is not full; returns (success, count)"""
+    if len(_PARTICIPANTS) >= MAX_PARTICIPANTS:
+        logger.info("List full, cannot add user %s", username)
+        return False, len(_PARTICIPANTS)
 
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("""INSERT INTO participants 
-                         (user_id, username) VALUES (?, ?)""",
-                      (user_id, username))
-        conn.commit()
-        success = cursor.rowcount > 0
-        logger.info(f"Added user {username} to list. Success: {success}")
-
-        # Log current entries for this user
-        cursor.execute("""
-            SELECT COUNT(*) FROM participants 
-            WHERE user_id=?
-        """, (user_id,))
-        entry_count = cursor.fetchone()[0]
-        logger.info(f"User {username} now has {entry_count} entries in the list")
-
-        return success
-    except sqlite3.Error as e:
-        logger.error(f"Database error: {e}")
-        return False
-    finally:
-        conn.close()
+    _PARTICIPANTS.append((user_id, username))
+    _invalidate_list_cache()
+    _PENDING.append((_INSERT_SQL, (user_id, username)))
+    logger.info("Added user %s to list. Success: True", username)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        entry_count = sum(1 for uid, _ in _PARTICIPANTS if uid == user_id)
+        logger.debug("User %s now has %d entries in the list", username, entry_count)
+
+    return True, len(_PARTICIPANTS)
 
 def remove_participant(user_id: int):
-    """Remove a single participant entry from the database"""
+    """Remove a participant's latest entry; returns (success, count)"""
+    for i in range(len(_PARTICIPANTS) - 1, -1, -1):
+        if _PARTICIPANTS[i][0] == user_id:
+            break
+    else:
+        return False, len(_PARTICIPANTS)
+
+    _, username = _PARTICIPANTS.pop(i)
+    _invalidate_list_cache()
+    _PENDING.append((_DELETE_LAST_SQL, (user_id,)))
+    logger.info("Successfully removed one entry for user %s", username)
+
+    if logger.isEnabledFor(logging.DEBUG):
+        remaining = sum(1 for uid, _ in _PARTICIPANTS if uid == user_id)
+        logger.debug("User %s has %d entries remaining", username, remaining)
+
+    return True, len(_PARTICIPANTS)
+
+def clear_participants():
+    """Remove every entry from the list"""
+    _PARTICIPANTS.clear()
+    _invalidate_list_cache()
+    # Earlier queued writes are superseded by the clear
+    _PENDING.clear()
+    _PENDING.append((_CLEAR_SQL, ()))
+
+def get_all_participants():
+    """Get list of all participants"""
+    return [username for _, username in _PARTICIPANTS]
+
+def _flush_pending(batch):
+    """Commit a batch of writes in a single transaction (runs on the DB thread)"""
     conn = get_db()
-    cursor = conn.cursor()
+    if not conn:
+        logger.error("Cannot flush %d pending writes: database is not open", len(batch))
+        return False
     try:
-        # Get the count before deletion
-        cursor.execute("""
-            SELECT username, COUNT(*) FROM participants 
-            WHERE user_id=?
-            GROUP BY username
-        """, (user_id,))
-        result = cursor.fetchone()
-        if result:
-            username, count = result
-            logger.info(f"User {username} has {count} entries before removal")
-
-        # Delete the most recent entry
-        cursor.execute("""
-            DELETE FROM participants 
-            WHERE id = (
-                SELECT id FROM participants 
-                WHERE user_id=? 
-                ORDER BY id DESC LIMIT 1
-            )
-        """, (user_id,))
-        conn.commit()
-        success = cursor.rowcount > 0
-
-        if success and result:
-            username = result[0]
-            logger.info(f"Successfully removed one entry for user {username}")
-            # Get remaining count
-            cursor.execute("""
-                SELECT COUNT(*) FROM participants 
-                WHERE user_id=?
-            """, (user_id,))
-            remaining = cursor.fetchone()[0]
-            logger.info(f"User {username} has {remaining} entries remaining")
-
-        return success
+        with conn:
+            # Consecutive writes of the same kind go through one executemany
+            for sql, ops in groupby(batch, key=itemgetter(0)):
+                conn.executemany(sql, [params for _, params in ops])
     except sqlite3.Error as e:
-        logger.error(f"Database error: {e}")
+        logger.error("Error flushing pending writes: %s", e)
         return False
-    finally:
-        conn.close()
+    return True
 
-def get_all_participants():
-    """Get list of all participants"""
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute("SELECT username FROM participants")
-    participants = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return participants
+async def flush_pending():
+    """Hand all queued writes to the DB thread, keeping them queued if the write fails"""
+    async with _FLUSH_LOCK:
+        if not _PENDING:
+            return
+
+        batch = _PENDING[:]
+        _PENDING.clear()
+        global _FLUSH_FAILURES
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(_DB_EXECUTOR, _flush_pending, batch):
+            # Retry on a later flush, ahead of anything queued meanwhile
+            _PENDING[:0] = batch
+            _FLUSH_FAILURES += 1
+            logger.warning("Requeued %d pending writes after a failed flush, retrying in %.1fs",
+                           len(batch), _flush_delay())
+        elif _FLUSH_FAILURES:
+            logger.info("Pending writes flushed again after %d failed attempts", _FLUSH_FAILURES)
+            _FLUSH_FAILURES = 0
+
+def _flush_delay():
+    """Seconds until the next periodic flush, doubling after each consecutive failure"""
+    # The exponent is capped too, so a long outage cannot overflow the float
+    return min(FLUSH_INTERVAL * 2 ** min(_FLUSH_FAILURES, 16), FLUSH_BACKOFF_MAX)
+
+async def flush_pending_periodically():
+    """Flush queued writes every FLUSH_INTERVAL seconds, backing off while flushes fail"""
+    while True:
+        await asyncio.sleep(_flush_delay())
+        # A flush already handed to the DB thread finishes even if we are cancelled
+        await asyncio.shield(flush_pending())
+
+async def post_init(application):
+    """Open the database, then start the keep-alive endpoint and the background flusher"""
+    # Initialize database
+    await setup_database()
+    # Keep the bot alive
+    await keep_alive()
+    global _FLUSH_TASK
+    _FLUSH_TASK = asyncio.create_task(flush_pending_periodically())
+
+async def post_shutdown(application):
+    """Persist any writes still queued at shutdown"""
+    if _FLUSH_TASK:
+        _FLUSH_TASK.cancel()
+        try:
+            await _FLUSH_TASK
+        except asyncio.CancelledError:
+            pass
+    await close_database()
+    await stop_keep_alive()
 
 async def clear_list(context: ContextTypes.DEFAULT_TYPE):
     """Clear the participants list on scheduled days"""
-    conn = get_db()
-    cursor = conn.cursor()
-    try:
-        cursor.execute("DELETE FROM participants")
-        conn.commit()
-        # Send message to all unique chats where the bot is active
-        chat_id = context.job.chat_id
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=RESPONSES['list_cleared']
-        )
-        logger.info("Global participant list cleared")
-    except sqlite3.Error as e:
-        logger.error(f"Error clearing list: {e}")
-    finally:
-        conn.close()
+    clear_participants()
+    # Send message to all unique chats where the bot is active
+    chat_id = context.job.chat_id
+    await context.bot.send_message(
+        chat_id=chat_id,
+        text=RESPONSES['list_cleared']
+    )
+    logger.info("Global participant list cleared")
+
+async def format_participants_list():
+    """Format the current participants list for display"""
+    global _CACHED_LIST_STR
+    if _CACHED_LIST_STR is not None:
+        return _CACHED_LIST_STR
 
-async def format_participants_list(participants):
-    """Format the participants list for display"""
+    participants = get_all_participants()
     if not participants:
-        return RESPONSES['list_empty']
+        _CACHED_LIST_STR = RESPONSES['list_empty']
+        return _CACHED_LIST_STR
 
     # Count occurrences of each participant
-    participant_counts = {}
-    for name in participants:
-        participant_counts[name] = participant_counts.get(name, 0) + 1
+    participant_counts = Counter(participants)
 
     # Format the list with counts
-    formatted_list = []
-    for name, count in participant_counts.items():
-        entry = f"👤 {name}"
-        if count > 1:
-            entry += f" (x{count})"
-        formatted_list.append(entry)
-
-    count = len(participants)  # Total entries
-    return f"Участники ({count}/{MAX_PARTICIPANTS}):\n" + "\n".join(formatted_list)
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle + and - messages in any chat"""
-    if not update.message or not update.message.text:
-        logger.info("Received update without message or text")
+    header = f"Участники ({len(participants)}/{MAX_PARTICIPANTS}):\n"
+    _CACHED_LIST_STR = header + "\n".join(
+        f"👤 {name} (x{count})" if count > 1 else f"👤 {name}"
+        for name, count in participant_counts.items()
+    )
+    return _CACHED_LIST_STR
+
+async def handle_plus(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle + messages in any chat"""
+    if not update.message:
         return
 
-    message = update.message.text.strip()
     user = update.effective_user
-    chat_type = update.effective_chat.type
 
-    logger.info(f"Received message: '{message}' from user {user.first_name} (ID: {user.id}) in chat type: {chat_type}")
+    try:
+        success, count = add_participant(user.id, user.first_name)
+        if success:
+            list_message = await format_participants_list()
+            await update.message.reply_text(
+                f"{_PARTICIPATED_TMPL.format(count)}\n\n{list_message}"
+            )
+            logger.info("User %s added to global list. Total: %d", user.first_name, count)
+            log_command(
+                user_id=user.id,
+                username=user.first_name,
+                command="participate",
+                message=f"Added to global list. Total: {count}"
+            )
+        else:
+            await update.message.reply_text(RESPONSES['list_full'])
+            logger.info("User %s attempted to join full list", user.first_name)
+    except Exception as e:
+        logger.error("Error processing command + from user %s: %s", user.first_name, e)
+        await update.message.reply_text(RESPONSES['error'])
+
+async def handle_minus(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle - messages in any chat"""
+    if not update.message:
+        return
 
-    if message in ["+", "-"]:
-        try:
-            if message == "+":
-                if add_participant(user.id, user.first_name):
-                    count = get_participants_count()
-                    participants = get_all_participants()
-                    list_message = await format_participants_list(participants)
-                    await update.message.reply_text(
-                        f"{RESPONSES['participated'].format(count, MAX_PARTICIPANTS)}\n\n{list_message}"
-                    )
-                    logger.info(f"User {user.first_name} added to global list. Total: {count}")
-                    log_command(
-                        user_id=user.id,
-                        username=user.first_name,
-                        command="participate",
-                        message=f"Added to global list. Total: {count}"
-                    )
-                else:
-                    await update.message.reply_text(RESPONSES['list_full'])
-                    logger.info(f"User {user.first_name} attempted to join full list")
-
-            elif message == "-":
-                if remove_participant(user.id):
-                    count = get_participants_count()
-                    participants = get_all_participants()
-                    list_message = await format_participants_list(participants)
-                    await update.message.reply_text(
-                        f"{RESPONSES['removed'].format(count, MAX_PARTICIPANTS)}\n\n{list_message}"
-                    )
-                    logger.info(f"User {user.first_name} removed from global list. Total: {count}")
-                    log_command(
-                        user_id=user.id,
-                        username=user.first_name,
-                        command="remove",
-                        message=f"Removed from global list. Total: {count}"
-                    )
-                else:
-                    await update.message.reply_text(RESPONSES['not_in_list'])
-                    logger.info(f"User {user.first_name} attempted to remove but wasn't in list")
-        except Exception as e:
-            logger.error(f"Error processing command {message} from user {user.first_name}: {str(e)}")
-            await update.message.reply_text(RESPONSES['error'])
+    user = update.effective_user
 
-    else:
-        # Only log unrecognized text messages for debugging
-        logger.info(f"Unrecognized message '{message}' received in {chat_type} chat")
+    try:
+        success, count = remove_participant(user.id)
+        if success:
+            list_message = await format_participants_list()
+            await update.message.reply_text(
+                f"{_REMOVED_TMPL.format(count)}\n\n{list_message}"
+            )
+            logger.info("User %s removed from global list. Total: %d", user.first_name, count)
+            log_command(
+                user_id=user.id,
+                username=user.first_name,
+                command="remove",
+                message=f"Removed from global list. Total: {count}"
+            )
+        else:
+            await update.message.reply_text(RESPONSES['not_in_list'])
+            logger.info("User %s attempted to remove but wasn't in list", user.first_name)
+    except Exception as e:
+        logger.error("Error processing command - from user %s: %s", user.first_name, e)
+        await update.message.reply_text(RESPONSES['error'])
 
 async def list_participants_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List command handler"""
-    participants = get_all_participants()
-    list_message = await format_participants_list(participants)
+    list_message = await format_participants_list()
     await update.message.reply_text(list_message)
 
     log_command(
         user_id=update.effective_user.id,
         username=update.effective_user.first_name,
         command="/list",
-        message=f"Listed {len(participants)} participants"
+        message=f"Listed {get_participants_count()} participants"
     )
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -276,6 +383,24 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         message="Requested help information"
     )
 
+async def is_chat_admin(bot, chat_id: int, user_id: int):
+    """Check whether a user is a chat admin, trusting a positive answer for ADMIN_CACHE_TTL seconds"""
+    key = (chat_id, user_id)
+    now = time.monotonic()
+    checked_at = _ADMIN_CACHE.get(key)
+    if checked_at is not None and now - checked_at < ADMIN_CACHE_TTL:
+        return True
+
+    # Forget expired entries so the cache only holds recently confirmed admins
+    for expired in [k for k, t in _ADMIN_CACHE.items() if now - t >= ADMIN_CACHE_TTL]:
+        del _ADMIN_CACHE[expired]
+
+    member = await bot.get_chat_member(chat_id, user_id)
+    is_admin = member.status in ['creator', 'administrator']
+    if is_admin:
+        _ADMIN_CACHE[key] = now
+    return is_admin
+
 async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Clear command handler - only for admins"""
     # Check if user is admin
@@ -286,22 +411,17 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     try:
-        member = await context.bot.get_chat_member(chat.id, user.id)
-        is_admin = member.status in ['creator', 'administrator']
+        is_admin = await is_chat_admin(context.bot, chat.id, user.id)
 
         if not is_admin:
             await update.message.reply_text(RESPONSES['not_admin'])
-            logger.info(f"Non-admin user {user.first_name} attempted to clear list")
+            logger.info("Non-admin user %s attempted to clear list", user.first_name)
             return
 
-        conn = get_db()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM participants")
-        conn.commit()
-        conn.close()
+        clear_participants()
 
         await update.message.reply_text(RESPONSES['list_cleared'])
-        logger.info(f"Admin {user.first_name} cleared the participants list")
+        logger.info("Admin %s cleared the participants list", user.first_name)
 
         log_command(
             user_id=user.id,
@@ -310,22 +430,23 @@ async def clear_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             message="Manually cleared participant list"
         )
     except Exception as e:
-        logger.error(f"Error in clear command: {e}")
+        logger.error("Error in clear command: %s", e)
         await update.message.reply_text(RESPONSES['error'])
 
 def main():
     """Main function to run the bot"""
-    # Keep the bot alive
-    keep_alive()
-    # Initialize database
-    setup_database()
-
     # Create application
     if not BOT_TOKEN:
         logger.error("No BOT_TOKEN found in environment variables")
         return
 
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(BOT_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
@@ -333,10 +454,15 @@ def main():
     application.add_handler(CommandHandler("list", list_participants_cmd))
     application.add_handler(CommandHandler("clear", clear_command))
 
-    # Message handler for + and - commands with less restrictive filter
+    # Message handlers for + and - commands; other text never reaches the bot code
+    application.add_handler(MessageHandler(
+        filters.Regex(r'^\s*\+\s*$'),
+        handle_plus,
+        block=False
+    ))
     application.add_handler(MessageHandler(
-        filters.TEXT,
-        handle_message,
+        filters.Regex(r'^\s*-\s*$'),
+        handle_minus,
         block=False
     ))
 
@@ -7,7 +7,7 @@ BOT_TOKEN = '7804303718:AAHuALwgEUXtxhEoXGKcftu29_w_-L7n6vA'
 MAX_PARTICIPANTS = 15
 
 # Logging Configuration
-LOG_FILE = "bot_logs.json"
+LOG_FILE = "bot_logs.jsonl"
 
 # Command descriptions
 COMMAND_DESCRIPTIONS = {
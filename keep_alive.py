@@ -1,32 +1,36 @@
-from flask import Flask
-from threading import Thread
+from aiohttp import web
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask('')
+_runner = None
 
-@app.route('/')
-def home():
-    return "Bot is alive!"
+async def home(request):
+    return web.Response(text="Bot is alive!")
 
-def run():
-    try:
-        logger.info("Starting keep-alive server on port 8080")
-        app.run(host='0.0.0.0', port=8080)
-    except Exception as e:
-        logger.error(f"Error starting keep-alive server: {e}")
-        raise
+app = web.Application()
+app.router.add_get('/', home)
 
-def keep_alive():
+async def keep_alive():
+    """Serve the keep-alive endpoint on the running event loop"""
+    global _runner
+    logger.info("Starting keep-alive server on port 8080")
+    runner = web.AppRunner(app)
     try:
-        logger.info("Initializing keep-alive thread")
-        t = Thread(target=run)
-        t.daemon = True  # Make thread daemon so it exits when main thread exits
-        t.start()
-        logger.info("Keep-alive thread started successfully")
+        await runner.setup()
+        await web.TCPSite(runner, '0.0.0.0', 8080).start()
+        _runner = runner
+        logger.info("Keep-alive server started successfully")
     except Exception as e:
-        logger.error(f"Error in keep_alive: {e}")
-        raise
+        # The bot keeps running without the ping endpoint
+        logger.error("Error starting keep-alive server: %s", e)
+        await runner.cleanup()
+
+async def stop_keep_alive():
+    """Shut down the keep-alive endpoint"""
+    global _runner
+    if _runner:
+        await _runner.cleanup()
+        _runner = None
@@ -1,7 +1,11 @@
+import atexit
 import json
 from datetime import datetime
 import logging
+import queue
+from threading import Thread
 from typing import Dict, List
+from config import LOG_FILE
 
 def setup_logging():
     """Configure logging settings"""
@@ -10,35 +14,56 @@ def setup_logging():
         level=logging.INFO
     )
 
-def log_command(user_id: int, username: str, command: str, message: str):
-    """Log bot commands to JSON file"""
-    try:
+def _log_writer():
+    """Drain queued log entries and append them to the log file in batches"""
+    running = True
+    while running:
+        batch = [_LOG_Q.get()]
+        while not _LOG_Q.empty():
+            batch.append(_LOG_Q.get())
+        if _LOG_STOP in batch:
+            batch = [entry for entry in batch if entry is not _LOG_STOP]
+            running = False
+        if not batch:
+            continue
         try:
-            with open('bot_logs.json', 'r') as f:
-                logs = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logs = []
+            with open(LOG_FILE, 'a') as f:
+                f.write(''.join(
+                    json.dumps(entry, separators=(',', ':')) + '\n'
+                    for entry in batch
+                ))
+        except Exception as e:
+            logging.error("Error logging command: %s", e)
+
+# Log entries are written by a background thread so handlers never wait on disk
+_LOG_Q = queue.SimpleQueue()
+_LOG_STOP = object()
+_LOG_THREAD = Thread(target=_log_writer, daemon=True)
+_LOG_THREAD.start()
 
-        log_entry = {
-            'timestamp': datetime.now().isoformat(),
-            'user_id': user_id,
-            'username': username,
-            'command': command,
-            'message': message
-        }
-        
-        logs.append(log_entry)
+def stop_log_writer():
+    """Write out every queued entry and stop the log writer thread"""
+    if _LOG_THREAD.is_alive():
+        _LOG_Q.put(_LOG_STOP)
+        _LOG_THREAD.join()
 
-        with open('bot_logs.json', 'w') as f:
-            json.dump(logs, f, indent=2)
-            
-    except Exception as e:
-        logging.error(f"Error logging command: {e}")
+# Drain the queue before the interpreter kills the daemon thread
+atexit.register(stop_log_writer)
+
+def log_command(user_id: int, username: str, command: str, message: str):
+    """Queue a bot command for the JSON Lines log file"""
+    _LOG_Q.put({
+        'timestamp': datetime.now().isoformat(),
+        'user_id': user_id,
+        'username': username,
+        'command': command,
+        'message': message
+    })
 
 def get_logs() -> List[Dict]:
-    """Retrieve logs from JSON file"""
+    """Retrieve logs from JSON Lines file"""
     try:
-        with open('bot_logs.json', 'r') as f:
-            return json.load(f)
+        with open(LOG_FILE, 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
     except (FileNotFoundError, json.JSONDecodeError):
         return []